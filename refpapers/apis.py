@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from crossref.restful import Works  # type: ignore
+from crossref.restful import Works, Etiquette  # type: ignore
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 import arxiv  # type: ignore
@@ -63,7 +63,7 @@ class CachedApi(ABC):
 class CrossrefApi(CachedApi):
     def __init__(self, conf: Conf):
         self._conf = conf
-        self._works = Works()
+        self._works = Works(etiquette=self._etiquette(conf))
         self._cache = self._init_cache(conf, 'crossref')
 
     def paper_from_doi(self, doi: str, path=None) -> Optional[Paper]:
@@ -97,6 +97,17 @@ class CrossrefApi(CachedApi):
             'doi': doi,
         }
 
+    @staticmethod
+    def _etiquette(conf: Conf) -> Etiquette:
+        """ Identifying with a contact email gives access to the Crossref "polite" pool """
+        from refpapers import __version__
+        return Etiquette(
+            'refpapers',
+            __version__,
+            'https://github.com/Waino/refpapers',
+            conf.etiquette_email if conf.etiquette_email else 'anonymous',
+        )
+
     @staticmethod
     def _get_year(meta) -> Optional[int]:
         for key in ('published', 'issued', 'published-print', 'published-online'):
@@ -121,6 +132,7 @@ class CrossrefApi(CachedApi):
 class ArxivApi(CachedApi):
     def __init__(self, conf: Conf):
         self._conf = conf
+        self._client = arxiv.Client()
         self._cache = self._init_cache(conf, 'arxiv')
 
     def paper_from_id(self, id: str, path=None) -> Optional[Paper]:
@@ -134,7 +146,7 @@ class ArxivApi(CachedApi):
     def _fetch(self, id: str) -> Optional[Dict[str, Any]]:
         """ Returns metadata or None if id not found """
         try:
-            results = arxiv.Search(id_list=[id]).results()
+            results = self._client.results(arxiv.Search(id_list=[id]))
             result = next(results)
             title = result.title
             year = result.published.year
@@ -85,6 +85,7 @@ class Conf(BaseModel):
     git_uncommitted: GitNew = GitNew.WARN
     git_untracked: GitNew = GitNew.WARN
     use_scholar: bool = False
+    etiquette_email: Optional[str] = None
     paths: Paths
     software: Software = Software(viewers=dict(), extractors=dict())
 
@@ -2,14 +2,13 @@ import glob
 import os
 import re
 from dataclasses import dataclass
-from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Generator, Iterable, List, Match, Optional, Tuple
 from unidecode import unidecode
 
 from refpapers.logger import logger
 from refpapers.conf import Decisions, Conf
-from refpapers.schema import Paper, BibtexKey, IndexingAction
+from refpapers.schema import Paper, BibtexKey, IndexingAction, RE_UNWANTED
 from refpapers.utils import beautify_hyphen_compounds, beautify_contractions
 
 
@@ -24,7 +23,6 @@ RE_CAPWORDS = re.compile(r'([^A-Z])([A-Z])')
 RE_A_FOO = re.compile(r'(?<![A-Z])(A)([A-Z])')
 RE_MULTISPACE = re.compile(r'  *')
 RE_MULTIUNDER = re.compile(r'__*')
-RE_UNWANTED = re.compile(r'[^\w\+\.-]')
 
 SEPARATOR = '_-_'
 FMT_PARSE_ERROR = 'Unable to parse filename: {reason:18} - {file_path}'
@@ -34,23 +32,22 @@ def is_in_gitdir(path: Path) -> bool:
     return any(part == '.git' for part in path.parts)
 
 
-@lru_cache(None)
-def _ending_globs(all_endings: Iterable[str]) -> List[str]:
-    out = []
-    for ending in all_endings:
-        ending_glob = ['*.'] + ['[{}{}]'.format(char, char.upper()) for char in ending]
-        out.append(''.join(ending_glob))
-    return out
-
-
-def ending_globs(conf: Conf) -> List[str]:
-    all_endings = tuple(sorted(conf.all_endings()))
-    return _ending_globs(all_endings)
-
-
 def yield_all_paths(root, conf: Conf) -> Generator[IndexingAction, None, None]:
-    for ending_glob in ending_globs(conf):
-        for path in sorted(Path(root).rglob(ending_glob)):
+    # a single walk of the directory tree, collecting the paths of all endings
+    endings = sorted(conf.all_endings())
+    by_ending: Dict[str, List[Path]] = {ending: [] for ending in endings}
+    # matched with endswith rather than splitext, to allow endings containing dots (e.g. tar.gz)
+    suffixes = [(f'.{ending.lower()}', ending) for ending in endings]
+    for dir_path, dir_names, file_names in os.walk(root):
+        # don't descend into git internals, e.g. the git-annex object store
+        dir_names[:] = [dir_name for dir_name in dir_names if dir_name != '.git']
+        for file_name in file_names:
+            lower_name = file_name.lower()
+            for suffix, ending in suffixes:
+                if lower_name.endswith(suffix):
+                    by_ending[ending].append(Path(dir_path) / file_name)
+    for paths in by_ending.values():
+        for path in sorted(paths):
             yield IndexingAction('A', path)
 
 
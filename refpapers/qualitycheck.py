@@ -3,16 +3,12 @@ import Levenshtein
 import random
 from functools import lru_cache
 from pathlib import Path
-from rich.progress import track
 from typing import Sequence, Set, Tuple, List, Union
-from whoosh import index, qparser  # type: ignore
-from whoosh.query import Every  # type: ignore
-from whoosh.sorting import MultiFacet, ScoreFacet, FieldFacet   # type: ignore
 
 from refpapers.conf import Conf, Decisions
 from refpapers.logger import logger
-from refpapers.schema import Paper, BibtexKey, whoosh_schema
-from refpapers.search import result_to_paper
+from refpapers.schema import Paper, BibtexKey
+from refpapers.search import open_index, query_parser, result_to_paper
 from refpapers.utils import q
 from refpapers.view import print_details, question, console, prompt
 
@@ -165,9 +161,11 @@ def find_close_matches(
 def more_like_query(
     query: str, conf: Conf, limit=10,
 ) -> Tuple[Paper, Set[Paper]]:
+    from whoosh.sorting import MultiFacet, ScoreFacet, FieldFacet   # type: ignore
+
     fields = ["bibtex", "authors", "title"]
-    ix = index.open_dir(conf.paths.index)
-    qp = qparser.MultifieldParser(fields, schema=whoosh_schema)
+    ix = open_index(conf)
+    qp = query_parser(tuple(fields))
     q = qp.parse(query)
     # sort first by score, using as tiebreaker year
     # (can't break ties using first author in this scheme)
@@ -209,8 +207,8 @@ def more_like_paper(
 
     out: Set[Paper] = set()
     fields = ["bibtex", "authors", "title"]
-    ix = index.open_dir(conf.paths.index)
-    qp = qparser.MultifieldParser(fields, schema=whoosh_schema)
+    ix = open_index(conf)
+    qp = query_parser(tuple(fields))
     with ix.searcher() as s:
         for query in queries:
             q = qp.parse(query)
@@ -227,7 +225,10 @@ def more_like_paper(
 
 
 def all_duplicates(conf: Conf, decisions: Decisions):
-    ix = index.open_dir(conf.paths.index)
+    from rich.progress import track
+    from whoosh.query import Every  # type: ignore
+
+    ix = open_index(conf)
     all_dupes = dict()
     ignored = set((x.arg1, x.arg2) for x in decisions.get(decisions.IGNORE_DUPLICATE))
     with ix.searcher() as s:
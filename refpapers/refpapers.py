@@ -18,7 +18,6 @@ from refpapers.view import (
     question,
     console,
 )
-from refpapers.rename import AutoRenamer
 from refpapers.qualitycheck import all_duplicates
 
 
@@ -165,6 +164,8 @@ def check(confdir: Path) -> None:
               help='Path to directory containing conf.yml and stored state.'
               f' Default: {DEFAULT_CONFDIR}')
 def rename(path: Path, confdir: Path) -> None:
+    # the renamer pulls in prompt_toolkit, which the other commands do not need
+    from refpapers.rename import AutoRenamer
     conf, storedstate, decisions = load_conf(confdir)
     categories = AllCategories(conf).read()
 
@@ -183,6 +184,7 @@ def rename(path: Path, confdir: Path) -> None:
               help='Path to directory containing conf.yml and stored state.'
               f' Default: {DEFAULT_CONFDIR}')
 def inbox(open: bool, path: Path, shuffle: bool, confdir: Path) -> None:
+    from refpapers.rename import AutoRenamer
     conf, storedstate, decisions = load_conf(confdir)
     categories = AllCategories(conf).read()
 
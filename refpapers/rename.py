@@ -2,12 +2,11 @@ import os
 import random
 import re
 from collections import Counter, defaultdict
-from copy import copy
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pathlib import Path
 from prompt_toolkit.completion import Completer, Completion, WordCompleter
 from shutil import move
-from typing import List, Optional, Callable, Dict, Any, Generator, Union
+from typing import List, Optional, Callable, Dict, Any, Generator, Tuple, Union
 from unidecode import unidecode
 
 from refpapers.apis import CrossrefApi, ArxivApi, ScholarApi, paper_from_metadata
@@ -18,14 +17,17 @@ from refpapers.git import git_annex_add, git_annex_sync
 from refpapers.logger import logger
 from refpapers.schema import Paper, IndexingAction, BibtexKey
 from refpapers.search import search, extract_fulltext, extract_ids_from_fulltext, index_data
-from refpapers.utils import DeepDefaultDict, q
+from refpapers.utils import head_lines, q
 from refpapers.view import LongTask, print_fulltext, print_details, question, prompt, console
 from refpapers.qualitycheck import find_close_matches
 
 
+CategoryPath = Tuple[str, ...]
+
+
 class CategoryCompleter(Completer):
     def __init__(self, categories: AllCategories, search_func):
-        self._category_dict = self._prepare_data(categories)
+        self._by_prefix = self._prepare_data(categories)
         self._search_func = search_func
 
     def get_completions(self, document, complete_event):
@@ -37,20 +39,12 @@ class CategoryCompleter(Completer):
 
     def _literal_phase(self, query):
         parts = query.split('/')
-        prefix = parts[:-1]
+        prefix = tuple(parts[:-1])
         suffix = parts[-1]
 
-        # restrict search to descendants of already filled-in part
-        cursor = self._category_dict
-        for part in prefix:
-            if part not in cursor:
-                return
-            cursor = cursor[part]
-
+        # restrict search to descendants of already filled-in part.
         # if the same key is used in several parts of the tree, yield them all
-        by_key = defaultdict(list)
-        for key, completion in cursor.all_descendants(prefix):
-            by_key[key].append(completion)
+        by_key = self._by_prefix.get(prefix, {})
 
         # filter to keep only matching keys
         for key, completions in by_key.items():
@@ -68,15 +62,29 @@ class CategoryCompleter(Completer):
         for completion, _ in hit_categories.most_common():
             yield Completion(completion, start_position=-len(query))
 
-    def _prepare_data(self, categories: AllCategories):
-        category_dict = DeepDefaultDict()
+    def _prepare_data(self, categories: AllCategories) -> Dict[CategoryPath, Dict[str, List[CategoryPath]]]:
+        """ Maps each prefix to the keys of all its descendants,
+        and each key to the paths leading to it, both in depth-first order of the category tree """
+        tree: Dict[str, Dict] = dict()
         for cat in categories:
-            cursor = category_dict
+            cursor = tree
             for component in cat:
                 if len(component) == 0:
                     continue
-                cursor = cursor[component]
-        return category_dict
+                cursor = cursor.setdefault(component, dict())
+
+        by_prefix: Dict[CategoryPath, Dict[str, List[CategoryPath]]] = dict()
+
+        def visit(node: Dict[str, Dict], path: CategoryPath) -> None:
+            for key, child in node.items():
+                child_path = path + (key,)
+                # the subtree of each prefix is contiguous in a depth-first traversal
+                for i in range(len(child_path)):
+                    by_prefix.setdefault(child_path[:i], dict()).setdefault(key, []).append(child_path)
+                visit(child, child_path)
+
+        visit(tree, ())
+        return by_prefix
 
 
 def prompt_category(categories: AllCategories, search_func) -> str:
@@ -102,6 +110,8 @@ def prompt_bibtex(bibtex: BibtexKey) -> BibtexKey:
 RE_NONWORD = re.compile(r'\W')
 RE_MULTISPACE = re.compile(r'\s\s*')
 RE_TRAILING_NUMBER = re.compile(r'[0-9]*$')
+# a leading class that must match: not followed by a quantifier that allows zero repetitions
+RE_LEADING_CLASS = re.compile(r'^\^\[([^\]\^\\-]+)\](?![?*]|\{0|\{,)')
 
 
 @dataclass
@@ -113,19 +123,41 @@ class PromptField:
     extra: Optional[List[str]] = None
 
 
+def leading_chars(pattern: str) -> Optional[str]:
+    """ The characters that a match must start with,
+    if the pattern is anchored to a simple character class (e.g. ^[12]) """
+    if '|' in pattern:
+        # an alternative branch may start with anything
+        return None
+    m = RE_LEADING_CLASS.match(pattern)
+    if not m:
+        return None
+    return ''.join(sorted(set(m.group(1))))
+
+
 def prompt_metadata(fields: List[PromptField], fulltext: str) -> Dict[str, Any]:
     fulltext = RE_NONWORD.sub(' ', fulltext)
     fulltext = RE_MULTISPACE.sub(' ', fulltext)
     words = set(fulltext.split())
-    for word in set(words):
-        words.add(word.lower())
+    # both the original and lowercased forms are offered as completions
+    words |= {word.lower() for word in words if not word.islower()}
+    # sort once, and bucket by first char to avoid matching words that can not match
+    sorted_words = sorted(words)
+    by_first: Dict[str, List[str]] = defaultdict(list)
+    for word in sorted_words:
+        by_first[word[:1]].append(word)
     results: Dict[str, Any] = dict()
     for field in fields:
         if field.pattern:
             pat = re.compile(field.pattern)
-            filtered_words = [word for word in sorted(words) if pat.match(word)]
+            chars = leading_chars(field.pattern)
+            if chars is None:
+                candidates = sorted_words
+            else:
+                candidates = [word for char in chars for word in by_first.get(char, [])]
+            filtered_words = [word for word in candidates if pat.match(word)]
         else:
-            filtered_words = list(sorted(words))
+            filtered_words = list(sorted_words)
         if field.prefunc:
             filtered_words = list(sorted(set(field.prefunc(word) for word in filtered_words)))
         if field.extra:
@@ -167,8 +199,7 @@ class AutoRenamer:
         bibtex_overrides = {Path(decision.arg1): decision.arg2 for decision in self.decisions.get('OVERRIDE_BIBTEX')}
 
         # preprocess fulltext and display it
-        fulltext_top = [line for line in fulltext.split('\n') if len(line.strip()) > 0]
-        fulltext_top = fulltext_top[:15]
+        fulltext_top = head_lines(fulltext, 15)
         print_fulltext(fulltext_top, path)
 
         # extract identifiers that can be used to retrieve metadata from apis
@@ -361,8 +392,5 @@ class AutoRenamer:
     def _generate_path(self, paper: Paper, category: str, suffix: str):
         tags = category.split('/')
         path = Path(generate(paper, root=self.conf.paths.data, tags=tags))
-        # This violates the usual immutability of Paper, but we are modifying a copy
-        result = copy(paper)
-        result.path = path
-        result.tags = tuple(tags)
-        return result
+        # a new instance, so that no cached properties are carried over from the original
+        return replace(paper, path=path, tags=tuple(tags))
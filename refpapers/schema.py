@@ -1,14 +1,11 @@
 import re
 from dataclasses import dataclass
-from functools import total_ordering
+from functools import cached_property, lru_cache, total_ordering
 from pathlib import Path
 from typing import Tuple, Optional, Union
-from whoosh.analysis import StemmingAnalyzer, RegexTokenizer  # type: ignore
-from whoosh.fields import Schema, TEXT, KEYWORD, ID, NUMERIC  # type: ignore
 
 RE_BIBTEX = re.compile('^([a-z-].*)([0-9]{4})([a-z-].*)$')
-RE_TITLE_WORD = re.compile('^([a-z].*)$')
-SKIP_TITLE_WORDS = {'a', 'an', 'on', 'in', 'the'}
+SKIP_TITLE_WORDS = frozenset({'a', 'an', 'on', 'in', 'the'})
 RE_UNWANTED = re.compile(r'[^\w\+\.-]')
 
 
@@ -31,7 +28,7 @@ class BibtexKey:
         for word in title.split():
             word = word.lower()
             word = RE_UNWANTED.sub('', word)
-            if not RE_TITLE_WORD.match(word):
+            if not (word and 'a' <= word[0] <= 'z'):
                 continue
             if word in SKIP_TITLE_WORDS:
                 continue
@@ -60,6 +57,20 @@ class Paper:
     def suffix(self):
         return self.path.suffix
 
+    # joined forms of the tuple fields, as stored in the index
+
+    @cached_property
+    def authors_joined(self) -> str:
+        return ', '.join(self.authors)
+
+    @cached_property
+    def pub_type_joined(self) -> str:
+        return ' '.join(self.pub_type)
+
+    @cached_property
+    def tags_joined(self) -> str:
+        return ' '.join(self.tags)
+
     def __lt__(self, other: "Paper"):
         my_bibtex = str(self.bibtex)
         other_bibtex = str(other.bibtex)
@@ -88,20 +99,27 @@ class IndexingAction:
 
 SCHEMA_VERSION = 'v0.2'
 
-# Tokenize bibtex key alphabetic and numeric parts separately
-rt = RegexTokenizer(r'([a-z]+|[0-9]+)')
-
-whoosh_schema = Schema(
-    path=ID(stored=True),
-    bibtex=TEXT(stored=True, analyzer=rt, field_boost=100.0),
-    title=TEXT(stored=True, field_boost=30.0),
-    comment=TEXT(stored=True, field_boost=30.0),
-    authors=KEYWORD(stored=True, commas=True, lowercase=True, scorable=True, field_boost=60.0),
-    year=NUMERIC(stored=True, signed=False, sortable=True, field_boost=30.0),
-    body=TEXT(analyzer=StemmingAnalyzer()),
-    pub_type=KEYWORD(stored=True),
-    tags=KEYWORD(stored=True),
-    number=NUMERIC(stored=True, signed=False, sortable=True),
-    doi=ID(stored=True, field_boost=5.0),
-    arxiv=ID(stored=True, field_boost=5.0),
-)
+
+@lru_cache(None)
+def get_whoosh_schema():
+    """ The schema is built on first use, to avoid importing whoosh when not indexing or searching """
+    from whoosh.analysis import StemmingAnalyzer, RegexTokenizer  # type: ignore
+    from whoosh.fields import Schema, TEXT, KEYWORD, ID, NUMERIC  # type: ignore
+
+    # Tokenize bibtex key alphabetic and numeric parts separately
+    rt = RegexTokenizer(r'([a-z]+|[0-9]+)')
+
+    return Schema(
+        path=ID(stored=True),
+        bibtex=TEXT(stored=True, analyzer=rt, field_boost=100.0),
+        title=TEXT(stored=True, field_boost=30.0),
+        comment=TEXT(stored=True, field_boost=30.0),
+        authors=KEYWORD(stored=True, commas=True, lowercase=True, scorable=True, field_boost=60.0),
+        year=NUMERIC(stored=True, signed=False, sortable=True, field_boost=30.0),
+        body=TEXT(analyzer=StemmingAnalyzer()),
+        pub_type=KEYWORD(stored=True),
+        tags=KEYWORD(stored=True),
+        number=NUMERIC(stored=True, signed=False, sortable=True),
+        doi=ID(stored=True, field_boost=5.0),
+        arxiv=ID(stored=True, field_boost=5.0),
+    )
@@ -1,32 +1,54 @@
-import delegator  # type: ignore
 import os
 import re
+import shlex
+import signal
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import List, Generator, Tuple, Optional
-from whoosh import index, qparser  # type: ignore
-from whoosh.sorting import MultiFacet, ScoreFacet, FieldFacet   # type: ignore
-from rich.progress import track
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Generator, Set, Tuple, Optional
 
 from refpapers.conf import Conf, StoredState, Decisions, AllCategories, GitNew
 from refpapers.filesystem import yield_actions, parse, apply_all_filters
 from refpapers.git import current_commit, git_difftree, git_status
 from refpapers.logger import logger
-from refpapers.schema import Paper, BibtexKey, whoosh_schema, IndexingAction, SCHEMA_VERSION
-from refpapers.utils import q
+from refpapers.schema import Paper, BibtexKey, get_whoosh_schema, IndexingAction, SCHEMA_VERSION
 from refpapers.view import LongTask, print_git_indexingaction, console
 
 
-RE_DOI = re.compile(
-    r'(?:https://|info:)?\s*doi(?:\.org)?/?:?\s*'
-    r'(10\.[0-9]{4,}(?:[\./][0-9A-Z]+)?(?:[\._-][0-9A-Z]+)*)',
-    flags=re.IGNORECASE
+try:
+    # the ids are searched for using a linear-time regex engine, if available
+    import re2 as re_ids  # type: ignore
+except ImportError:
+    re_ids = re
+
+# the whitespace matched by \s in re, spelled out (as literal characters, not regex escapes),
+# as \s in re2 only matches ASCII whitespace. Both engines then find the same ids.
+WHITESPACE = '[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]'
+# case-insensitivity is set inline, as the flags argument is not portable between the engines
+RE_DOI = re_ids.compile(
+    r'(?i)(?:https://|info:)?' + WHITESPACE + r'*doi(?:\.org)?/?:?' + WHITESPACE + r'*'
+    r'(10\.[0-9]{4,}(?:[\./][0-9A-Z]+)?(?:[\._-][0-9A-Z]+)*)'
 )
-RE_ARXIV = re.compile(
-    r'arXiv:\s*[0-9]{4}\.[0-9]{4,5}(?:v[0-9]+)?',
-    flags=re.IGNORECASE
+RE_ARXIV = re_ids.compile(
+    r'(?i)arXiv:' + WHITESPACE + r'*[0-9]{4}\.[0-9]{4,5}(?:v[0-9]+)?'
 )
-RE_ARXIV_PREFIX = re.compile(r'arXiv:\s*', flags=re.IGNORECASE)
+RE_ARXIV_PREFIX = re_ids.compile(r'(?i)arXiv:' + WHITESPACE + r'*')
+
+# fulltext extraction is parallelized over worker processes
+MAX_EXTRACT_WORKERS = 8
+# limits the number of extracted fulltexts waiting to be indexed
+MAX_PENDING = 32
+# memory used by the index writer before flushing a segment
+WRITER_LIMITMB = 256
+MAX_WRITER_PROCS = 4
+# extractors running this much longer than extract_max_seconds are killed
+EXTRACT_TIMEOUT_MARGIN = 5.0
 
 
 def index_data(full: bool, conf: Conf, storedstate: StoredState, decisions: Decisions):
@@ -67,37 +89,33 @@ def _find_papers_to_index(
     decisions: Decisions,
     commit: Optional[str]
 ) -> List[IndexingAction]:
+    actions: Iterable[IndexingAction]
     if full:
-        actions = list(yield_actions(conf.paths.data, conf, decisions))
+        actions = yield_actions(conf.paths.data, conf, decisions)
     else:
         assert commit is not None
         console.print(f'[status]Performing incremental indexing from commit {commit}')
-        actions = git_difftree(conf.paths.data, commit)
+        action_sources: List[Iterable[IndexingAction]] = [git_difftree(conf.paths.data, commit)]
         if not (conf.git_uncommitted == GitNew.IGNORE and conf.git_untracked == GitNew.IGNORE):
             staged: List[IndexingAction]
             untracked: List[IndexingAction]
             staged, untracked = git_status(conf.paths.data)
-            staged = list(apply_all_filters(staged, conf, decisions))
-            untracked = list(apply_all_filters(untracked, conf, decisions))
 
             if conf.git_uncommitted == GitNew.WARN:
-                for ia in staged:
+                for ia in apply_all_filters(staged, conf, decisions):
                     print_git_indexingaction(ia, 'STAGED')
             elif conf.git_uncommitted == GitNew.ADD:
                 # add staged actions to index
-                actions.extend(staged)
+                action_sources.append(staged)
 
             if conf.git_untracked == GitNew.WARN:
-                for ia in untracked:
+                for ia in apply_all_filters(untracked, conf, decisions):
                     print_git_indexingaction(ia, 'UNTRACKED')
-                pass
             elif conf.git_untracked == GitNew.ADD:
-                # add untracked actions to index
-                for ia in untracked:
-                    # convert '??' to 'A'
-                    actions.append(IndexingAction('A', ia.paper))
+                # add untracked actions to index, converting '??' to 'A'
+                action_sources.append(IndexingAction('A', ia.paper) for ia in untracked)
 
-        actions = list(apply_all_filters(actions, conf, decisions))
+        actions = apply_all_filters(chain.from_iterable(action_sources), conf, decisions)
 
     bibtex_overrides = {Path(decision.arg1): decision.arg2 for decision in decisions.get('OVERRIDE_BIBTEX')}
     papers = []
@@ -111,15 +129,18 @@ def _find_papers_to_index(
 
 
 def _index_papers(papers: List[IndexingAction], full: bool, conf: Conf, decisions: Decisions):
+    from rich.progress import track
+    from whoosh import index  # type: ignore
+
     os.makedirs(conf.paths.index, exist_ok=True)
     all_categories = AllCategories(conf)
     if full:
-        ix = index.create_in(conf.paths.index, whoosh_schema)
+        ix = index.create_in(conf.paths.index, get_whoosh_schema())
     else:
         ix = index.open_dir(conf.paths.index)
         all_categories.read()
 
-    too_slow = set(x.arg1 for x in decisions.get(decisions.FULLTEXT_TOO_SLOW))
+    too_slow = frozenset(str(x.arg1) for x in decisions.get(decisions.FULLTEXT_TOO_SLOW))
 
     if not full:
         # avoid duplicates from mixed full and incremental indexing
@@ -129,55 +150,76 @@ def _index_papers(papers: List[IndexingAction], full: bool, conf: Conf, decision
         console.print('[status]Already up to date[/status]')
         return
 
-    start = datetime.now()
-    w = ix.writer()
-    added = 0
-    deleted = 0
-    for ia in track(papers, description='Indexing...'):
-        if ia.paper is None:
-            continue
-        if not isinstance(ia.paper, Paper):
-            raise Exception(f'Indexing requires a Paper, not a {type(ia.paper).__name__}')
-
-        paper = ia.paper
-        if paper is None:
-            continue
-        assert paper.path.is_absolute(), f'Relative path in indexing: {paper.path}'
-        path = str(paper.path)
-
-        if ia.action == 'A':
-            if path in too_slow:
-                logger.info(f'Skipping this file (was too slow previously): {path}')
-            else:
-                body = extract_fulltext(paper.path, conf, decisions)
-                doi, arxiv = extract_ids_from_fulltext(body, paper.path, conf)
-            added += 1
-            fields = {
-                'path': path,
-                'bibtex': str(paper.bibtex),
-                'title': paper.title,
-                'comment': '',
-                'authors': ', '.join(paper.authors),
-                'year': paper.year,
-                'body': body,
-                'pub_type': ' '.join(paper.pub_type),
-                'tags': ' '.join(paper.tags),
-            }
-            if paper.number:
-                fields['number'] = paper.number
-            if doi:
-                fields['doi'] = doi
-            if arxiv:
-                fields['arxiv'] = arxiv
-            w.add_document(**fields)
-            all_categories.add(tuple(paper.tags))
-        elif ia.action == 'D':
-            deleted += 1
-            w.delete_by_term('path', path)
+    to_extract = [
+        ia.paper.path for ia in papers
+        if ia.action == 'A' and isinstance(ia.paper, Paper) and str(ia.paper.path) not in too_slow
+    ]
+
+    # extraction runs in worker processes, the writer stays in the main process
+    with _extraction_pool(to_extract, conf) as extracted:
+        start = datetime.now()
+        if full:
+            # a full indexing is a bulk add, which whoosh can spread over several processes
+            w = ix.writer(limitmb=WRITER_LIMITMB, procs=min(os.cpu_count() or 1, MAX_WRITER_PROCS))
+        else:
+            w = ix.writer(limitmb=WRITER_LIMITMB)
+        added = 0
+        deleted = 0
+        try:
+            for ia in track(papers, description='Indexing...'):
+                if ia.paper is None:
+                    continue
+                if ia.action == 'D':
+                    # deletions only need the path
+                    deleted += 1
+                    w.delete_by_term('path', str(ia.path))
+                    continue
+                if not isinstance(ia.paper, Paper):
+                    raise Exception(f'Indexing requires a Paper, not a {type(ia.paper).__name__}')
+
+                paper = ia.paper
+                assert paper.path.is_absolute(), f'Relative path in indexing: {paper.path}'
+                path = str(paper.path)
+
+                if ia.action == 'A':
+                    if path in too_slow:
+                        logger.info(f'Skipping this file (was too slow previously): {path}')
+                        body, doi, arxiv = '', None, None
+                    else:
+                        body, doi, arxiv, was_too_slow = next(extracted)
+                        if was_too_slow:
+                            # keep track of slow files to skip next time
+                            decisions.add(decisions.FULLTEXT_TOO_SLOW, paper.path)
+                    added += 1
+                    fields = {
+                        'path': path,
+                        'bibtex': str(paper.bibtex),
+                        'title': paper.title,
+                        'comment': '',
+                        'authors': paper.authors_joined,
+                        'year': paper.year,
+                        'body': body,
+                        'pub_type': paper.pub_type_joined,
+                        'tags': paper.tags_joined,
+                    }
+                    if paper.number:
+                        fields['number'] = paper.number
+                    if doi:
+                        fields['doi'] = doi
+                    if arxiv:
+                        fields['arxiv'] = arxiv
+                    w.add_document(**fields)
+                    all_categories.add(tuple(paper.tags))
+        except BaseException:
+            # e.g. a failing worker or ^C: release the writer (and its subprocesses) without committing
+            w.cancel()
+            raise
     add_del = '' if full else f' ({added} added/{deleted} deleted)'
     message = f'[status]Indexing [status.hi]{len(papers)} papers{add_del}[/status.hi][/status]'
     with LongTask(message) as ltask:
         w.commit()
+        # a full indexing recreates the index, which is not detected by up_to_date
+        _INDEX_CACHE.pop(conf.paths.index, None)
         decisions.write()
         all_categories.write()
         delta = datetime.now() - start
@@ -191,19 +233,51 @@ def _index_papers(papers: List[IndexingAction], full: bool, conf: Conf, decision
 
 
 def deduplicate(papers: List[IndexingAction], conf) -> List[IndexingAction]:
+    known = indexed_paths(conf)
     result: List[IndexingAction] = []
     for ia in papers:
         if ia.action != 'A':
             # only deduplicate adds
             result.append(ia)
             continue
-        if len(list(search(str(ia.path), conf=conf, decisions=None, limit=1, fields=['path']))) > 0:
+        if str(ia.path) in known:
             print(f'Path already indexed: {ia.path}')
             continue
         result.append(ia)
     return result
 
 
+def indexed_paths(conf: Conf) -> Set[str]:
+    """ The paths of all papers currently in the index """
+    ix = open_index(conf)
+    with ix.reader() as reader:
+        # stored fields of deleted documents are skipped, unlike the terms in the lexicon
+        return {fields['path'] for fields in reader.all_stored_fields()}
+
+
+# opened indices, by index directory
+_INDEX_CACHE: Dict[Path, Any] = dict()
+
+
+def open_index(conf: Conf):
+    """ Opens the index, reusing a previously opened one if the index has not changed since """
+    from whoosh import index  # type: ignore
+
+    ix = _INDEX_CACHE.get(conf.paths.index, None)
+    if ix is None or not ix.up_to_date():
+        ix = index.open_dir(conf.paths.index)
+        _INDEX_CACHE[conf.paths.index] = ix
+    return ix
+
+
+@lru_cache(8)
+def query_parser(fields: Tuple[str, ...]):
+    """ The schema does not change at runtime, so parsers can be reused """
+    from whoosh import qparser  # type: ignore
+
+    return qparser.MultifieldParser(list(fields), schema=get_whoosh_schema())
+
+
 def result_to_paper(result) -> Paper:
     if len(result['pub_type']) > 0:
         pub_type = result['pub_type'].split(' ')
@@ -248,10 +322,12 @@ def search(
     fields: Optional[List[str]] = None,
     silent: bool = False
 ) -> Generator[Paper, None, None]:
+    from whoosh.sorting import MultiFacet, ScoreFacet, FieldFacet   # type: ignore
+
     if fields is None:
         fields = ["bibtex", "authors", "title", "comment", "body"]
-    ix = index.open_dir(conf.paths.index)
-    qp = qparser.MultifieldParser(fields, schema=whoosh_schema)
+    ix = open_index(conf)
+    qp = query_parser(tuple(fields))
     q = qp.parse(query)
     # sort first by score, using as tiebreaker year
     # (can't break ties using first author in this scheme)
@@ -270,30 +346,196 @@ def search(
 
 
 def extract_fulltext(path: Path, conf: Conf, decisions: Decisions) -> str:
+    fulltext, too_slow = _extract_fulltext(path, conf)
+    if too_slow:
+        # keep track of slow files to skip next time
+        decisions.add(decisions.FULLTEXT_TOO_SLOW, path)
+    return fulltext
+
+
+def _extract_fulltext(path: Path, conf: Conf) -> Tuple[str, bool]:
+    """ Returns the fulltext, and whether the extraction was too slow """
     if path is None:
-        return ''
+        return '', False
     _, ending = os.path.splitext(path)
     extractor = conf.software.get_extractor(ending)
     if not extractor or extractor.lower() == 'none':
-        return ''
+        return '', False
+    if extractor.lower() in ('auto', 'pymupdf'):
+        extractor = _resolve_pdf_extractor(extractor.lower())
     resolved_path = path.resolve()
     start = datetime.now()
-    result = delegator.run(f'{extractor} {q(resolved_path)} -')
+    if extractor.lower() == 'pymupdf':
+        maybe_fulltext = _extract_pymupdf(resolved_path, conf.fulltext_chars)
+    else:
+        timeout = conf.extract_max_seconds + EXTRACT_TIMEOUT_MARGIN
+        try:
+            maybe_fulltext = _extract_command(extractor, resolved_path, timeout, conf.fulltext_chars)
+        except subprocess.TimeoutExpired:
+            logger.warning(
+                f'Full text extraction timed out after {timeout} seconds,'
+                f' will skip file in the future: {path}')
+            return '', True
     delta = datetime.now() - start
     total = delta.total_seconds()
-    if not result.return_code == 0:
+    if maybe_fulltext is None:
         logger.warning(f'Extraction failed for {resolved_path}')
-        return ''
-    fulltext = result.out
+        return '', False
+    fulltext = maybe_fulltext
     if conf.fulltext_chars and len(fulltext) > conf.fulltext_chars:
         fulltext = fulltext[:conf.fulltext_chars]
-    # keep track of slow files to skip next time
-    if total > conf.extract_max_seconds:
+    too_slow = total > conf.extract_max_seconds
+    if too_slow:
         logger.warning(
             f'Full text extraction was too slow {total} > {conf.extract_max_seconds} seconds,'
             f' will skip file in the future: {path}')
-        decisions.add(decisions.FULLTEXT_TOO_SLOW, path)
-    return fulltext
+    return fulltext, too_slow
+
+
+def _extract_command(extractor: str, path: Path, timeout: float, max_bytes: Optional[int]) -> Optional[str]:
+    """ Runs an external extractor command, without a shell. Reads at most max_bytes of output.
+    Returns None if extraction fails. Raises subprocess.TimeoutExpired after killing a too slow extractor. """
+    try:
+        # the extractor may include arguments, e.g. "pdftotext -l 20"
+        command = shlex.split(extractor) + [str(path), '-']
+        # in a session of its own, so that any subprocesses of the extractor can be killed with it
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except (ValueError, OSError):
+        # a malformed extractor (e.g. unbalanced quotes) or a missing command fails only this file
+        return None
+    assert proc.stdout is not None
+    timed_out = threading.Event()
+
+    def _kill():
+        if not hasattr(os, 'killpg'):
+            # not available on Windows, where only the extractor itself is killed
+            proc.kill()
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _timeout():
+        timed_out.set()
+        _kill()
+
+    timer = threading.Timer(timeout, _timeout)
+    timer.start()
+    try:
+        out = proc.stdout.read(max_bytes) if max_bytes else proc.stdout.read()
+        truncated = max_bytes is not None and max_bytes > 0 and len(out) >= max_bytes
+        if truncated:
+            # the rest of the output is not needed
+            _kill()
+        returncode = proc.wait()
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(command, timeout)
+    if not truncated and not returncode == 0:
+        return None
+    return out.decode('utf-8', 'replace')
+
+
+@lru_cache(None)
+def _has_pymupdf() -> bool:
+    # cached, as a failed import is retried (searching sys.path) every time
+    try:
+        import fitz  # type: ignore # noqa
+        return True
+    except ImportError:
+        return False
+
+
+@lru_cache(None)
+def _resolve_pdf_extractor(extractor: str) -> str:
+    """ Both auto and pymupdf use PyMuPDF if it is installed, otherwise pdftotext """
+    if _has_pymupdf():
+        return 'pymupdf'
+    if extractor == 'pymupdf':
+        # cached, to warn only once
+        logger.warning('PyMuPDF is not installed (pip install refpapers[pymupdf]), using pdftotext instead')
+    return 'pdftotext'
+
+
+def _extract_pymupdf(path: Path, max_chars: Optional[int]) -> Optional[str]:
+    """ In-process extraction using the optional PyMuPDF dependency.
+    Stops reading pages after max_chars. Returns None if extraction fails. """
+    import fitz  # type: ignore
+    pages: List[str] = []
+    total = 0
+    try:
+        with fitz.open(path) as doc:
+            for page in doc:
+                text = page.get_text('text')
+                pages.append(text)
+                total += len(text)
+                if max_chars and total >= max_chars:
+                    break
+    except Exception:
+        return None
+    return ''.join(pages)
+
+
+# fulltext, doi, arxiv id, and whether the extraction was too slow
+ExtractResult = Tuple[str, Optional[str], Optional[str], bool]
+
+# the configuration of an extraction worker process, set by the pool initializer
+_WORKER_CONF: Optional[Conf] = None
+
+
+def _init_extract_worker(conf: Conf) -> None:
+    global _WORKER_CONF
+    _WORKER_CONF = conf
+
+
+def _extract_in_worker(path: Path) -> ExtractResult:
+    assert _WORKER_CONF is not None, 'Extraction worker was not initialized'
+    return _extract_for_indexing(path, _WORKER_CONF)
+
+
+@contextmanager
+def _extraction_pool(paths: List[Path], conf: Conf) -> Generator[Iterator[ExtractResult], None, None]:
+    """ Extracts the papers in worker processes, yielding an iterator over the results in order """
+    if not paths:
+        yield iter(())
+        return
+    # the configuration is sent to each worker once, instead of with every paper
+    with ProcessPoolExecutor(
+        max_workers=min(len(paths), os.cpu_count() or 1, MAX_EXTRACT_WORKERS),
+        initializer=_init_extract_worker,
+        initargs=(conf,),
+    ) as executor:
+        # start the workers before the index writer and the progress bar start threads of their own,
+        # as forking a process with running threads is unsafe
+        executor.submit(os.getpid).result()
+        yield _bounded_map(executor, _extract_in_worker, paths, MAX_PENDING)
+
+
+def _extract_for_indexing(path: Path, conf: Conf) -> ExtractResult:
+    """ The extraction step of indexing a single paper. Runs in a worker process. """
+    body, too_slow = _extract_fulltext(path, conf)
+    doi, arxiv = extract_ids_from_fulltext(body, path, conf)
+    return body, doi, arxiv, too_slow
+
+
+def _bounded_map(executor: Executor, func: Callable, items: Iterable, max_pending: int) -> Iterator:
+    """ Like executor.map, but submits lazily to keep at most max_pending results in memory """
+    pending: Deque[Future] = deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
 
 
 def remove_prefixes(ids):
@@ -306,14 +548,20 @@ def remove_prefixes(ids):
 
 def extract_ids_from_fulltext(fulltext: str, path: Path, conf: Conf) -> Tuple[Optional[str], Optional[str]]:
     fulltext = fulltext[:conf.ids_chars]
-    dois = set(RE_DOI.findall(fulltext))
-    dois = remove_prefixes(dois)
-    arxivs = set(RE_ARXIV_PREFIX.sub('', x) for x in RE_ARXIV.findall(fulltext))
-    arxivs = remove_prefixes(arxivs)
-    if len(dois) > 1:
-        logger.warning(f'Found too many DOIs in {path}: {dois}')
-    if len(arxivs) > 1:
-        logger.warning(f'Found too many arXiv ids in {path}: {arxivs}')
-    doi = list(dois)[0] if len(dois) == 1 else None
-    arxiv = list(arxivs)[0] if len(arxivs) == 1 else None
+    # both patterns require a literal anchor, which is much cheaper to look for than running the regex
+    lower = fulltext.lower()
+    doi = None
+    arxiv = None
+    if 'doi' in lower:
+        dois = set(RE_DOI.findall(fulltext))
+        dois = remove_prefixes(dois)
+        if len(dois) > 1:
+            logger.warning(f'Found too many DOIs in {path}: {dois}')
+        doi = list(dois)[0] if len(dois) == 1 else None
+    if 'arxiv:' in lower:
+        arxivs = set(RE_ARXIV_PREFIX.sub('', x) for x in RE_ARXIV.findall(fulltext))
+        arxivs = remove_prefixes(arxivs)
+        if len(arxivs) > 1:
+            logger.warning(f'Found too many arXiv ids in {path}: {arxivs}')
+        arxiv = list(arxivs)[0] if len(arxivs) == 1 else None
     return doi, arxiv
@@ -1,57 +1,60 @@
 from pathlib import Path
-from typing import List, Optional, Callable
+from typing import BinaryIO, List, Optional, Callable
 from json import JSONDecodeError
 import json
 import re
 import shlex
 
+try:
+    # faster json (de)serialization, if available
+    from orjson import loads as json_loads, dumps as json_dumps  # type: ignore
+except ImportError:
+    json_loads = json.loads  # type: ignore
 
-class DeepDefaultDict(dict):
-    def __getitem__(self, key):
-        if key not in self:
-            self[key] = self.__class__()
-        return super().__getitem__(key)
-
-    def all_descendants(self, prefix: List[str]):
-        for key, child in self.items():
-            new_prefix = prefix + [key]
-            yield (key, new_prefix)
-            try:
-                yield from child.all_descendants(new_prefix)
-            except AttributeError:
-                # ignore values that are not DeepDefaultDict-like
-                pass
+    def json_dumps(obj) -> bytes:  # type: ignore
+        return json.dumps(obj).encode('utf-8')
 
 
 class JsonFileCache:
     """ Json-L file-backed append-only key-value cache """
     def __init__(self, path: Path, hit_func: Optional[Callable] = None):
         self.path = path
+        # opened on first write, and kept open
+        self._fout: Optional[BinaryIO] = None
         self._data = self._read()
         self.hit_func = hit_func
 
     def _read(self):
         result = dict()
         if self.path.exists():
-            with self.path.open('r') as fin:
-                try:
-                    for i, line in enumerate(fin):
-                        lst = json.loads(line)
-                        if len(lst) != 2:
-                            raise ValueError(
-                                f'Can not parse line {i} of {self.path}: saw {len(lst)} values, expecting 2.'
-                            )
-                        key, val = lst
-                        result[key] = val
-                except JSONDecodeError as e:
-                    raise ValueError(f'Can not parse line {i} of {self.path}: {e}')
+            try:
+                for i, line in enumerate(self.path.read_bytes().splitlines()):
+                    lst = json_loads(line)
+                    if len(lst) != 2:
+                        raise ValueError(
+                            f'Can not parse line {i} of {self.path}: saw {len(lst)} values, expecting 2.'
+                        )
+                    key, val = lst
+                    result[key] = val
+            except JSONDecodeError as e:
+                raise ValueError(f'Can not parse line {i} of {self.path}: {e}')
         return result
 
     def _write(self, key, val):
         self._data[key] = val
-        with self.path.open('a') as fout:
-            json.dump([key, val], fout)
-            fout.write('\n')
+        if self._fout is None:
+            self._fout = self.path.open('ab', buffering=1 << 16)
+        self._fout.write(json_dumps([key, val]) + b'\n')
+        # flush each line, to not lose cached values if interrupted
+        self._fout.flush()
+
+    def close(self):
+        if self._fout is not None:
+            self._fout.close()
+            self._fout = None
+
+    def __del__(self):
+        self.close()
 
     def get(self, key, func):
         if key in self._data:
@@ -64,17 +67,13 @@ class JsonFileCache:
 
 
 HYPHEN_JOIN_PREFIXES = ['cross', 'low', 'multi', 'n', 'non', 'pre', 'semi', 'sub']
-HYPHEN_PATTERNS = [
-    re.compile(r'\b(' + prefix + r')-([\w])', flags=re.IGNORECASE)
-    for prefix in HYPHEN_JOIN_PREFIXES
-]
+RE_HYPHEN_PREFIX = re.compile(r'\b(' + '|'.join(HYPHEN_JOIN_PREFIXES) + r')-(?=[\w])', flags=re.IGNORECASE)
 RE_INTRAWORD_HYPHEN = re.compile(r'([\w])-([\w])', flags=re.IGNORECASE)
 
 
 def beautify_hyphen_compounds(text: str) -> str:
     # The selected prefixes are joined to the suffix by removal of the hyphe
-    for pattern in HYPHEN_PATTERNS:
-        text = pattern.sub(r'\1\2', text)
+    text = RE_HYPHEN_PREFIX.sub(r'\1', text)
     # The remaining intraword hyphens are converted to spaces
     text = RE_INTRAWORD_HYPHEN.sub(r'\1 \2', text)
     return text
@@ -87,13 +86,28 @@ CONTRACTIONS = [
     ("'s", "s"),
     ("won't", "wont"),
 ]
-CONTRACTION_PATTERNS = [(re.compile(pat + r'\b'), repl) for (pat, repl) in CONTRACTIONS]
+CONTRACTION_MAP = dict(CONTRACTIONS)
+# all contractions in one pass. At a given position, the first listed alternative wins
+RE_CONTRACTIONS = re.compile('|'.join(re.escape(pat) + r'\b' for (pat, _) in CONTRACTIONS))
 
 
 def beautify_contractions(text: str) -> str:
-    for pattern, replacement in CONTRACTION_PATTERNS:
-        text = pattern.sub(replacement, text)
-    return text
+    return RE_CONTRACTIONS.sub(lambda m: CONTRACTION_MAP[m.group(0)], text)
+
+
+def head_lines(text: str, n: int) -> List[str]:
+    """ The first n non-empty lines of the text, without splitting all of it """
+    result: List[str] = []
+    start = 0
+    while len(result) < n and start < len(text):
+        end = text.find('\n', start)
+        if end < 0:
+            end = len(text)
+        line = text[start:end]
+        if len(line.strip()) > 0:
+            result.append(line)
+        start = end + 1
+    return result
 
 
 def q(path: Path):
@@ -1,25 +1,31 @@
-import prompt_toolkit
+import re
 import sys
 from enum import Enum
-from itertools import groupby
+from functools import lru_cache
+from itertools import groupby, islice
+from operator import attrgetter, itemgetter
 from pathlib import Path
-from prompt_toolkit import HTML
-from prompt_toolkit.completion import Completer, WordCompleter
-from prompt_toolkit.styles import Style
 from rich.console import Console
-from rich.live import Live
+from rich.markup import escape
 from rich.table import Table
 from rich.text import Text
 from rich.theme import Theme
-from typing import List, Iterable, Union, Optional, Tuple, Dict
+from typing import List, Iterable, Union, Optional, Tuple, Dict, TYPE_CHECKING
 
-from refpapers.schema import Paper, BibtexKey, IndexingAction
+if TYPE_CHECKING:
+    # prompt_toolkit and rich.live are only needed for interactive use, and are imported when used
+    from prompt_toolkit import HTML
+    from prompt_toolkit.completion import Completer
+    from prompt_toolkit.styles import Style
 
-Renderable = Union[str, Text]
+from refpapers.schema import Paper, BibtexKey, IndexingAction
 
 MAX_LEN_AUTHORS = 50
+MIN_LEN_AUTHORS_COLUMN = 20
+LIST_CHUNK_SIZE = 50
 
 
+@lru_cache(None)
 def to_prompt_toolkit(val):
     bold = 'bold ' in val
     dim = not bold and 'dim ' in val
@@ -52,11 +58,23 @@ THEME = {
     'warning': 'bold red',
     'rule.line': 'dim cyan',
 }
-console = Console(theme=Theme(THEME))
-prompt_toolkit_style = Style.from_dict({
-    key: to_prompt_toolkit(val)
-    for key, val in THEME.items()
-})
+if sys.stdout.isatty():
+    console = Console(theme=Theme(THEME))
+else:
+    # styles are not output when piped, so skip the highlighting pass.
+    # Markup is still parsed, to strip the tags.
+    console = Console(theme=Theme(THEME), highlight=False)
+
+
+@lru_cache(None)
+def get_prompt_toolkit_style() -> 'Style':
+    """ The style is only needed for interactive prompts, so it is built on first use """
+    from prompt_toolkit.styles import Style
+    return Style.from_dict({
+        key: to_prompt_toolkit(val)
+        for key, val in THEME.items()
+    })
+
 
 PUB_TYPE_FLAGS = {
     'book': 'B',
@@ -64,31 +82,25 @@ PUB_TYPE_FLAGS = {
     'survey': '[survey]S[/survey]',
     'thesis': '[thesis]T[/thesis]',
 }
+# the printed width of each flag, without markup
+PUB_TYPE_FLAG_WIDTHS = {key: len(Text.from_markup(val)) for key, val in PUB_TYPE_FLAGS.items()}
 
 
-def to_html(rich_str: str) -> HTML:
-    for tag, _ in THEME.items():
-        rich_str = rich_str.replace(f'[{tag}]', f'<{tag}>')
-        rich_str = rich_str.replace(f'[/{tag}]', f'</{tag}>')
-    return HTML(rich_str)
+RE_THEME_TAG = re.compile(r'\[(/?)(' + '|'.join(map(re.escape, THEME)) + r')\]')
 
 
-def blending_columns(left: Renderable, right: Renderable) -> Table:
-    """ Produces a single renderable
-    that allows two columns to blend into each other """
-    grid = Table.grid(expand=True)
-    grid.add_column()
-    grid.add_column(max_width=2)
-    grid.add_column(justify="right")
-    grid.add_row(left, '  ', right)
-    return grid
+def to_html(rich_str: str) -> 'HTML':
+    from prompt_toolkit import HTML
+    return HTML(RE_THEME_TAG.sub(r'<\1\2>', rich_str))
 
 
 def render_authors(authors: Tuple[str, ...], truncate=True) -> str:
     out = ['[authors.first]{}[/authors.first]'.format(authors[0])]
     if len(authors) > 1:
         out.append('[authors], ')
-        if truncate and len(', '.join(authors)) > MAX_LEN_AUTHORS:
+        # length of the joined authors, without joining them
+        joined_len = sum(len(author) for author in authors) + 2 * (len(authors) - 1)
+        if truncate and joined_len > MAX_LEN_AUTHORS:
             out.append('etAl')
         else:
             out.append(', '.join(authors[1:]))
@@ -99,71 +111,94 @@ def render_bibtex(bibtex: BibtexKey) -> str:
     return f'[bib]{bibtex.author}[/bib][year]{bibtex.year}[/year][bib]{bibtex.word}[/bib]'
 
 
-def render_list_item(paper: Paper, i: int, grid: Table) -> None:
-    flags = ''.join(PUB_TYPE_FLAGS.get(pub_type, '') for pub_type in paper.pub_type)
-    authors = render_authors(paper.authors)
-    left = blending_columns(
-        '•',
-        Text(paper.bibtex.author, style='bib', no_wrap=True)
-    )
-    mid = Text(str(paper.bibtex.year), style='year')
-    right = blending_columns(
-        Text(paper.bibtex.word, style='bib', no_wrap=True),
-        flags
-    )
-    grid.add_row(left, mid, right, ' ', authors)
-    grid.add_row('', '', '', ' ', Text(paper.title, style='title.even'))
+@lru_cache(128)
+def flags_for(pub_types: Tuple[str, ...]) -> Tuple[str, int]:
+    """ Returns the flags markup and its printed width.
+    Few distinct combinations of publication types occur, so they are cached """
+    flags = ''.join(PUB_TYPE_FLAGS.get(pub_type, '') for pub_type in pub_types)
+    flags_width = sum(PUB_TYPE_FLAG_WIDTHS.get(pub_type, 0) for pub_type in pub_types)
+    return flags, flags_width
 
 
-def print_list_section(papers: Iterable[Paper], left_width: int, right_width: int) -> None:
-    grid = Table.grid(expand=True)
-    grid.add_column(width=left_width)           # left: bibauthor
-    grid.add_column(min_width=4, max_width=4)   # mid: year
-    grid.add_column(min_width=right_width)      # right: bibword, flags
-    grid.add_column(max_width=1)                # padding
-    grid.add_column(ratio=6)                    # authors / title
-    for (i, paper) in enumerate(papers):
-        render_list_item(paper, i, grid)
-    console.print(grid)
+def format_list_row(paper: Paper, left_width: int, right_width: int) -> str:
+    """ Renders the bibtex key and flags of a list item as a single markup string,
+    padded to the column widths """
+    flags, flags_width = flags_for(paper.pub_type)
+    author = escape(paper.bibtex.author.rjust(left_width - 1))
+    word = escape(paper.bibtex.word.ljust(right_width - flags_width))
+    return f'•[bib]{author}[/bib][year]{paper.bibtex.year:<4}[/year][bib]{word}[/bib]{flags} '
+
 
+def key_column_width(left_width: int, right_width: int) -> int:
+    """ The width of the rows produced by format_list_row: bibauthor, year, bibword with flags, padding """
+    return left_width + 4 + right_width + 1
 
-def print_section_heading(heading: Union[str, Iterable[str]], field: Optional[str] = None) -> None:
-    if field == 'tags':
-        heading = ' / '.join(heading)
-    console.rule(f'[rule.line]─ [heading]{heading}[/heading]', align='left')
 
+def print_list_section(papers: Iterable[Paper], left_width: int, right_width: int, authors_width: int) -> None:
+    # the papers are printed in chunks, so that output starts before all rows are rendered.
+    # The column widths are fixed, so the chunks line up.
+    papers = iter(papers)
+    while True:
+        chunk = list(islice(papers, LIST_CHUNK_SIZE))
+        if not chunk:
+            break
+        grid = Table.grid()
+        grid.add_column(width=key_column_width(left_width, right_width), no_wrap=True)  # bibtex key, flags
+        grid.add_column(width=authors_width)    # authors / title
+        for paper in chunk:
+            grid.add_row(format_list_row(paper, left_width, right_width), render_authors(paper.authors))
+            grid.add_row('', Text(paper.title, style='title.even'))
+        console.print(grid)
 
-def sorted_groups(papers: List[Paper], grouping_key) -> List[Tuple[str, List[Paper]]]:
-    ranked_papers = sorted(enumerate(papers), key=lambda x: x[1].__getattribute__(grouping_key))
-    grouped = groupby(ranked_papers, key=lambda x: x[1].__getattribute__(grouping_key))
-    grouped_dict: Dict[str, List[Paper]] = {}
-    group_scores: List[Tuple[float, str]] = []
-    for key, ranked_group in grouped:
-        key = tuple(key)
-        group_ranks, group_papers = zip(*ranked_group)
+
+GroupKey = Union[str, int, Tuple[str, ...]]
+
+
+def print_section_heading(heading: GroupKey, field: Optional[str] = None) -> None:
+    if field == 'tags' and isinstance(heading, tuple):
+        heading_str = ' / '.join(heading)
+    else:
+        heading_str = str(heading)
+    console.rule(f'[rule.line]─ [heading]{heading_str}[/heading]', align='left')
+
+
+def sorted_groups(papers: List[Paper], grouping_key) -> List[Tuple[GroupKey, List[Paper]]]:
+    key_fn = attrgetter(grouping_key)
+    # the rank breaks ties between equal keys, so papers are never compared
+    ranked_papers = sorted((key_fn(paper), rank, paper) for rank, paper in enumerate(papers))
+    scored_groups: List[Tuple[float, GroupKey, List[Paper]]] = []
+    for key, ranked_group in groupby(ranked_papers, key=itemgetter(0)):
+        # only sequences (e.g. tags) are converted, scalar keys such as the year are kept as is
+        key = tuple(key) if isinstance(key, (list, tuple)) else key
+        _, group_ranks, group_papers = zip(*ranked_group)
         # the group score combines the best rank and the average rank
         group_score = min(group_ranks) + (sum(group_ranks) / len(group_ranks))
-        group_scores.append((group_score, key))
-        grouped_dict[key] = list(group_papers)
-    result: List[Tuple[str, List[Paper]]] = []
-    for group_score, key in sorted(group_scores):
-        result.append((key, grouped_dict[key]))
-    return result
+        scored_groups.append((group_score, key, list(group_papers)))
+    # keys are unique, so the paper lists are never compared
+    return [(key, group_papers) for _, key, group_papers in sorted(scored_groups)]
 
 
 def print_list(papers: List[Paper], grouped=None) -> None:
     if len(papers) == 0:
         return
-    longest_author = max(len(paper.bibtex.author) for paper in papers)
-    longest_bibword = max(len(paper.bibtex.word) for paper in papers)
+    longest_author = 0
+    longest_bibword = 0
+    longest_flags = len('Pres')
+    for paper in papers:
+        bibtex = paper.bibtex
+        longest_author = max(longest_author, len(bibtex.author))
+        longest_bibword = max(longest_bibword, len(bibtex.word))
+        longest_flags = max(longest_flags, flags_for(paper.pub_type)[1])
     left_width = max(12, longest_author + 3)
-    right_width = longest_bibword + 2 + len('Pres')
+    right_width = longest_bibword + 2 + longest_flags
+    # all column widths are fixed, so that rich does not need to distribute the space
+    authors_width = max(MIN_LEN_AUTHORS_COLUMN, console.size.width - key_column_width(left_width, right_width))
     if grouped:
         for key, group in sorted_groups(papers, grouped):
             print_section_heading(key, grouped)
-            print_list_section(group, left_width, right_width)
+            print_list_section(group, left_width, right_width, authors_width)
     else:
-        print_list_section(papers, left_width, right_width)
+        print_list_section(papers, left_width, right_width, authors_width)
 
 
 def print_details(paper: Paper) -> None:
@@ -196,19 +231,25 @@ def expand_choice(query: str, choices: Dict[str, str]) -> Optional[str]:
     if query in choices:
         # keys have priority
         return choices[query]
-    matches = [choice for choice in choices.values() if query in choice]
+    matches = []
+    prefix_matches = []
+    for choice in choices.values():
+        if query in choice:
+            matches.append(choice)
+            if choice.startswith(query):
+                prefix_matches.append(choice)
     if len(matches) == 1:
         # accept any unique substring
         return matches[0]
-    matches = [choice for choice in matches if choice.startswith(query)]
-    if len(matches) == 1:
+    if len(prefix_matches) == 1:
         # accept a unique query even if it occurs as a substring later
-        return matches[0]
+        return prefix_matches[0]
     # otherwise too ambiguous
     return None
 
 
 def question(prompt_str: str, choices: Union[List[str], Dict[str, str]]) -> Optional[str]:
+    from prompt_toolkit.completion import WordCompleter
     if isinstance(choices, list):
         assert len(set(choice[0] for choice in choices)) == len(choices), \
             'Choices must have unique first chars'
@@ -231,26 +272,35 @@ def question(prompt_str: str, choices: Union[List[str], Dict[str, str]]) -> Opti
 
 
 def prompt(
-    prompt_str: str, completer: Optional[Completer] = None, default: Optional[str] = None
+    prompt_str: str, completer: Optional['Completer'] = None, default: Optional[str] = None
 ) -> str:
     if sys.stdin.isatty():
+        import prompt_toolkit
         prompt_str = f'[prompt]{prompt_str}[/prompt]'
         default = default if default else ''
         return prompt_toolkit.prompt(
             to_html(prompt_str),
             completer=completer,
             default=default,
-            style=prompt_toolkit_style,
+            style=get_prompt_toolkit_style(),
         )
     else:
         # input is a non-interactive (e.g. pipe)
         return console.input(prompt_str)
 
 
+GIT_ACTION_NAMES = {'A': 'added', 'M': 'modified', 'D': 'deleted', '??': 'untracked'}
+
+
+@lru_cache(None)
+def phase_prefix(phase: str) -> str:
+    style = phase.lower()
+    return f'[{style}]{phase:10}[/{style}]'
+
+
 def print_git_indexingaction(ia: IndexingAction, phase: str):
-    action_map = {'A': 'added', 'M': 'modified', 'D': 'deleted', '??': 'untracked'}
-    expanded = action_map.get(ia.action, ia.action)
-    console.print(f'[{phase.lower()}]{phase:10}[/{phase.lower()}] [action]{expanded:10}[/action] {ia.paper}')
+    expanded = GIT_ACTION_NAMES.get(ia.action, ia.action)
+    console.print(f'{phase_prefix(phase)} [action]{expanded:10}[/action] {ia.paper}')
 
 
 class LongTaskStatus(Enum):
@@ -286,16 +336,19 @@ class LongTask:
         self.message = message
         self.status: Union[str, Text] = ''
         self._live = None
+        # the message and status currently on screen
+        self._shown: Optional[Tuple[Union[str, Text], Union[str, Text]]] = None
 
     def set_status(self, status: Union[str, Text, LongTaskStatus]):
         if isinstance(status, LongTaskStatus):
             self.status = self._status_map[status]
         else:
             self.status = status
-        if self._live:
+        if self._live and (self.message, self.status) != self._shown:
             self._live.update(self._render(), refresh=True)
 
     def _render(self):
+        self._shown = (self.message, self.status)
         grid = Table.grid(expand=True)
         grid.add_column()
         grid.add_column(justify="right")
@@ -303,6 +356,7 @@ class LongTask:
         return grid
 
     def __enter__(self):
+        from rich.live import Live
         self._live = Live(self._render(), auto_refresh=False).__enter__()
         return self
 
@@ -320,6 +374,5 @@ class LongTask:
 def print_fulltext(fulltext: List[str], path: Path) -> None:
     print('\n')
     console.rule(f'[rule.line]─ [heading]Head of {path}[/heading]', align='left')
-    for line in fulltext:
-        print(line)
+    sys.stdout.write(''.join(f'{line}\n' for line in fulltext))
     console.rule()
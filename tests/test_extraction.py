@@ -1,8 +1,11 @@
 import pytest
+import shlex
+import subprocess
+import time
 from pathlib import Path
 from unittest.mock import MagicMock
 
-from refpapers.search import remove_prefixes, extract_ids_from_fulltext
+from refpapers.search import remove_prefixes, extract_ids_from_fulltext, _extract_command
 
 
 @pytest.mark.parametrize(
@@ -43,6 +46,11 @@ def test_remove_prefixes(inp, expected):
             ' although not for the same paper lol',
             '10.1145/3299869.3314036', '2004.04002'
         ),
+        (
+            # non-breaking spaces
+            'Foo doi:\xa010.1101/708206 and arXiv:\xa02004.04002',
+            '10.1101/708206', '2004.04002'
+        ),
     ]
 )
 def test_extract_ids_from_fulltext(inp, expected_doi, expected_arxiv):
@@ -50,3 +58,46 @@ def test_extract_ids_from_fulltext(inp, expected_doi, expected_arxiv):
     result_doi, result_arxiv = extract_ids_from_fulltext(inp, Path('.'), mock_conf)
     assert result_doi == expected_doi
     assert result_arxiv == expected_arxiv
+
+
+def write_extractor(tmp_path: Path, body: str) -> str:
+    script = tmp_path / 'extractor.sh'
+    script.write_text(f'#!/bin/sh\n{body}\n')
+    script.chmod(0o755)
+    return shlex.quote(str(script))
+
+
+@pytest.mark.parametrize(
+    'body,max_bytes,expected',
+    [
+        # arguments in the extractor string come before the path and the output argument
+        ('printf "%s|%s|%s" "$@"', None, '--opt|paper.pdf|-'),
+        # output is truncated, and the extractor killed
+        ('while :; do printf 0123456789; done', 25, '0123456789012345678901234'),
+        # failing extractors produce no text
+        ('printf partial; exit 1', None, None),
+    ]
+)
+def test_extract_command(tmp_path, body, max_bytes, expected):
+    extractor = write_extractor(tmp_path, body) + ' --opt'
+    assert _extract_command(extractor, Path('paper.pdf'), 10, max_bytes) == expected
+
+
+@pytest.mark.parametrize(
+    'extractor',
+    [
+        '/no/such/extractor',
+        'pdftotext "unbalanced',
+    ]
+)
+def test_extract_command_invalid(extractor):
+    assert _extract_command(extractor, Path('paper.pdf'), 10, None) is None
+
+
+def test_extract_command_timeout(tmp_path):
+    extractor = write_extractor(tmp_path, 'sleep 10 & sleep 10')
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        _extract_command(extractor, Path('paper.pdf'), 0.5, None)
+    # also the subprocess of the extractor, which keeps the output open, is killed
+    assert time.monotonic() - start < 5
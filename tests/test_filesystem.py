@@ -1,27 +1,33 @@
 import pytest
 import yaml
 from pathlib import Path
+from unittest.mock import MagicMock
 
 from refpapers.conf import Conf
 from refpapers.filesystem import (
-    ending_globs,
     keep_valid_endings,
     is_in_gitdir,
     uncapword,
     capword,
     parse,
     generate,
+    yield_all_paths,
 )
 from refpapers.schema import IndexingAction
+from refpapers.utils import beautify_hyphen_compounds
 from .test_conf import STANDARD_YAML
 
 
-def test_ending_globs():
-    d = yaml.safe_load(STANDARD_YAML)
-    conf = Conf(**d)
-    result = ending_globs(conf)
-    assert len(result) >= 0
-    assert all(glob.startswith('*.') for glob in result)
+def test_yield_all_paths(tmp_path):
+    for path in ['a/X.PDF', 'a/b.pdf', 'a/.git/annex/y.pdf', 'c/z.tar.gz', 'c/w.txt']:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).touch()
+    conf = MagicMock()
+    conf.all_endings.return_value = {'pdf', 'tar.gz', 'gz'}
+    result = [ia.paper.relative_to(tmp_path).as_posix() for ia in yield_all_paths(tmp_path, conf)]
+    # grouped by ending (case-insensitively), paths sorted within each ending. Git internals are skipped.
+    assert result == ['c/z.tar.gz', 'a/X.PDF', 'a/b.pdf', 'c/z.tar.gz']
+    assert all(ia.action == 'A' for ia in yield_all_paths(tmp_path, conf))
 
 
 def test_keep_valid_endings():
@@ -92,6 +98,21 @@ def test_capword(inp, expected):
     assert capword(inp) == expected
 
 
+@pytest.mark.parametrize(
+    'inp,expected',
+    [
+        ('non-autoregressive models', 'NonautoregressiveModels'),
+        ('Multi-lingual NMT', 'MultilingualNmt'),
+        ('well-known', 'WellKnown'),
+        ('n-gram', 'Ngram'),
+        # chained prefixes are all joined
+        ('pre-sub-x', 'Presubx'),
+    ]
+)
+def test_capword_hyphen_compounds(inp, expected):
+    assert capword(beautify_hyphen_compounds(inp)) == expected
+
+
 @pytest.mark.parametrize(
     'path',
     [
@@ -0,0 +1,55 @@
+import pytest
+from prompt_toolkit.document import Document
+
+from refpapers.rename import CategoryCompleter, leading_chars
+
+
+@pytest.mark.parametrize(
+    'pattern,expected',
+    [
+        (r'^[12][0-9]{3}$', '12'),
+        (r'^[ba]+x', 'ab'),
+        (r'^[12]{1,2}x', '12'),
+        (r'^[12]?\d+', None),
+        (r'^[ab]*x', None),
+        (r'^[ab]{0,2}x', None),
+        (r'^[ab]{,2}x', None),
+        (r'^[12]\d{3}|foo', None),
+        (r'^[a-z]+', None),
+        (r'^[^a]', None),
+        (r'[12]', None),
+        (r'.*', None),
+    ]
+)
+def test_leading_chars(pattern, expected):
+    assert leading_chars(pattern) == expected
+
+
+CATEGORIES = [
+    ('ml', 'nlp', 'mt'),
+    ('ml', 'vision'),
+    ('nlp', 'parsing'),
+    ('ml', '', 'rl'),
+    ('stats',),
+]
+
+
+@pytest.mark.parametrize(
+    'query,expected',
+    [
+        # all keys in depth-first order, each followed by all paths leading to it
+        ('', ['ml', 'ml/nlp', 'nlp', 'ml/nlp/mt', 'ml/vision', 'ml/rl', 'nlp/parsing', 'stats']),
+        # a key in several branches
+        ('nl', ['ml/nlp', 'nlp']),
+        # only descendants of the prefix. Empty components are skipped
+        ('ml/', ['ml/nlp', 'ml/nlp/mt', 'ml/vision', 'ml/rl']),
+        ('ml/r', ['ml/rl']),
+        ('nlp/', ['nlp/parsing']),
+        # unknown prefix
+        ('foo/n', []),
+    ]
+)
+def test_category_completer(query, expected):
+    completer = CategoryCompleter(CATEGORIES, lambda query: [])
+    completions = completer.get_completions(Document(query), None)
+    assert [completion.text for completion in completions] == expected
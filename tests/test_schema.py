@@ -32,3 +32,17 @@ def test_bibtexkey(inp, author, year, word):
 def test_bibtexkey_invalid(inp):
     with pytest.raises(ValueError):
         BibtexKey.parse(inp)
+
+
+@pytest.mark.parametrize(
+    'inp,expected',
+    [
+        ('An example title', 'example'),
+        ('The 2nd coming of Foo', 'coming'),
+        ('On: "quoted" words', 'quoted'),
+        ('123 456', ''),
+        ('', ''),
+    ]
+)
+def test_title_word(inp, expected):
+    assert BibtexKey.title_word(inp) == expected
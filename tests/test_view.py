@@ -1,7 +1,29 @@
-from refpapers.view import print_list
+import pytest
+from pathlib import Path
+
+from refpapers.schema import Paper, BibtexKey
+from refpapers.view import print_list, sorted_groups
 
 
 def test_print_list_empty():
     # neither should raise an exception
     print_list([])
     print_list([], grouped='tags')
+
+
+@pytest.mark.parametrize(
+    'grouping_key,expected',
+    [
+        ('tags', [(('a',), [0, 2]), (('b', 'c'), [1])]),
+        ('year', [(2020, [0, 1]), (2019, [2])]),
+    ]
+)
+def test_sorted_groups(grouping_key, expected):
+    papers = [
+        Paper(
+            Path(f'{i}.pdf'), BibtexKey('author', year, 'word'), 'title', ('Author',), year, (), tags, None, None, None
+        )
+        for i, (year, tags) in enumerate([(2020, ('a',)), (2020, ('b', 'c')), (2019, ('a',))])
+    ]
+    result = sorted_groups(papers, grouping_key)
+    assert [(key, [papers.index(paper) for paper in group]) for key, group in result] == expected